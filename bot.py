@@ -1,13 +1,18 @@
+import asyncio
+import functools
 import logging
 import os
+import re
 import sys
 from datetime import datetime
+from typing import Optional, Protocol, cast
 
 from dotenv import load_dotenv
-from sqlalchemy import select
+from sqlalchemy import CursorResult, lambda_stmt, select, update
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     ApplicationBuilder,
     CommandHandler,
@@ -19,8 +24,13 @@ from telegram.ext import (
 )
 from telegram import BotCommand, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
 
-from database import Monitor, async_session, init_db, get_all_active_monitors
-from monitor import PageMonitor
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None  # type: ignore[assignment]
+
+from database import Monitor, async_session, count_monitors, init_db, get_all_active_monitors, get_pool_status
+from monitor import PageMonitor, PageState
 
 # Load environment variables
 load_dotenv()
@@ -40,6 +50,20 @@ FOLLOW_URL, FOLLOW_FREQ = range(2)
 REMOVE_SELECT = 2
 UPDATE_SELECT, UPDATE_FREQ = range(3, 5)
 
+# Telegram allows about 30 messages per second overall
+TELEGRAM_MAX_RATE = 30
+TELEGRAM_MAX_RETRIES = 3
+
+# Job scheduling (seconds)
+FIRST_CHECK_DELAY = 10  # Wait before the first check to avoid startup spikes
+RESTORE_SPREAD = 60  # Window over which restored jobs make their first check
+
+# http(s) scheme, a host, and no whitespace
+_URL_RE = re.compile(r"^https?://[^\s/$.?#].[^\s]*$")
+
+# Keyboards are immutable, so identical monitor lists can share one markup
+KEYBOARD_CACHE_SIZE = 256
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sends a welcome message."""
@@ -75,13 +99,13 @@ async def follow_url_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     url = update.message.text.strip()
 
     # Basic URL validation
-    if not url.startswith("http"):
+    if not _URL_RE.match(url):
         await update.message.reply_text("❌ Invalid URL. Must start with http:// or https://\nPlease try again.")
         return FOLLOW_URL
 
     # Verify URL is reachable
     status_msg = await update.message.reply_text(f"🔍 Verifying {url}...")
-    content = PageMonitor.fetch_content(url)
+    content = await asyncio.to_thread(PageMonitor.fetch_content, url)
     
     if not content:
         await status_msg.edit_text("❌ Could not fetch URL. Please check if it works and try again.")
@@ -114,16 +138,19 @@ async def follow_freq_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     content = context.user_data["follow_content"]
     user_id = update.effective_chat.id
     
-    current_hash = PageMonitor.get_content_hash(PageMonitor.clean_content(content))
+    # Parsing a large page takes long enough to stall the event loop
+    current_hash = await asyncio.to_thread(
+        lambda: PageMonitor.get_content_hash(PageMonitor.clean_content(content))
+    )
 
     # Save to DB
     async with async_session() as session:
         # Check if already exists
         result = await session.execute(
-            select(Monitor).where(
+            lambda_stmt(lambda: select(Monitor).where(
                 Monitor.user_id == user_id,
                 Monitor.url == url
-            )
+            ))
         )
         existing = result.scalars().first()
         
@@ -131,10 +158,13 @@ async def follow_freq_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
             existing.frequency = interval
             existing.is_active = True
             existing.content_hash = current_hash
+            existing.raw_hash = None
+            existing.etag = None
+            existing.last_modified = None
             existing.last_checked = datetime.now()
             monitor_id = existing.id
             await session.commit()
-            await update.message.reply_text(f"✅ Updated existing monitor for {url} to {interval} minutes.")
+            reply = f"✅ Updated existing monitor for {url} to {interval} minutes."
         else:
             new_monitor = Monitor(
                 user_id=user_id,
@@ -148,7 +178,11 @@ async def follow_freq_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await session.commit()
             await session.refresh(new_monitor)
             monitor_id = new_monitor.id
-            await update.message.reply_text(f"✅ Started monitoring {url} every {interval} minutes.")
+            reply = f"✅ Started monitoring {url} every {interval} minutes."
+
+    await update.message.reply_text(reply)
+
+    get_monitor_cache(context.bot_data)[monitor_id] = PageState(content_hash=current_hash)
 
     # Schedule Job
     schedule_monitor_job(context.application, monitor_id, url, user_id, interval)
@@ -171,13 +205,23 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_monitor_keyboard(user_id: int):
     """Helper to get a keyboard of monitors."""
     async with async_session() as session:
-        result = await session.execute(select(Monitor).where(Monitor.user_id == user_id, Monitor.is_active == True))
-        monitors = result.scalars().all()
-    
+        result = await session.execute(
+            lambda_stmt(lambda: select(Monitor.id, Monitor.url, Monitor.frequency).where(
+                Monitor.user_id == user_id, Monitor.is_active.is_(True)
+            ))
+        )
+        monitors = tuple(tuple(row) for row in result.all())
+
+    return build_monitor_keyboard(monitors)
+
+
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def build_monitor_keyboard(monitors: tuple) -> InlineKeyboardMarkup | None:
+    """Builds the keyboard for (id, url, frequency) rows; cached per row set."""
     keyboard = []
-    for m in monitors:
+    for monitor_id, url, frequency in monitors:
         # Callback data: "action|id"
-        keyboard.append([InlineKeyboardButton(f"{m.url} ({m.frequency}m)", callback_data=str(m.id))])
+        keyboard.append([InlineKeyboardButton(f"{url} ({frequency}m)", callback_data=str(monitor_id))])
     
     return InlineKeyboardMarkup(keyboard) if keyboard else None
 
@@ -205,20 +249,24 @@ async def remove_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     async with async_session() as session:
         monitor = await session.get(Monitor, monitor_id)
-        if monitor and monitor.user_id == user_id:
+        if monitor is not None and monitor.user_id != user_id:
+            monitor = None  # Other users' monitors count as not found
+        if monitor is not None:
             monitor.is_active = False # Soft delete or check logic
             # Actually we can just delete or set inactive. Let's delete for now as per previous logic.
             # But previous logic had `await session.delete(monitor)`.
             # Let's match previous logic:
             await session.delete(monitor)
             await session.commit()
-            
-            # Remove job
-            remove_jobs_by_name(context.application, str(monitor_id))
-            
-            await query.edit_message_text(f"🗑️ Stopped monitoring {monitor.url}.")
-        else:
-            await query.edit_message_text("❌ Monitor not found or already deleted.")
+
+    if monitor is not None:
+        # Remove job
+        remove_jobs_by_name(context.application, str(monitor_id))
+        get_monitor_cache(context.bot_data).pop(monitor_id, None)
+        
+        await query.edit_message_text(f"🗑️ Stopped monitoring {monitor.url}.")
+    else:
+        await query.edit_message_text("❌ Monitor not found or already deleted.")
             
     return ConversationHandler.END
 
@@ -264,16 +312,19 @@ async def update_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     async with async_session() as session:
         monitor = await session.get(Monitor, monitor_id)
-        if monitor and monitor.user_id == user_id:
+        if monitor is not None and monitor.user_id != user_id:
+            monitor = None  # Other users' monitors count as not found
+        if monitor is not None:
             monitor.frequency = interval
             await session.commit()
-            
-            # Reschedule
-            schedule_monitor_job(context.application, monitor.id, monitor.url, user_id, interval)
-            
-            await update.message.reply_text(f"✅ Updated frequency to {interval} minutes for {monitor.url}.")
-        else:
-            await update.message.reply_text("❌ Monitor not found.")
+
+    if monitor is not None:
+        # Reschedule
+        schedule_monitor_job(context.application, monitor.id, monitor.url, user_id, interval)
+        
+        await update.message.reply_text(f"✅ Updated frequency to {interval} minutes for {monitor.url}.")
+    else:
+        await update.message.reply_text("❌ Monitor not found.")
             
     del context.user_data["update_monitor_id"]
     return ConversationHandler.END
@@ -288,24 +339,54 @@ async def list_monitors(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     async with async_session() as session:
         result = await session.execute(
-            select(Monitor).where(Monitor.user_id == user_id)
+            lambda_stmt(lambda: select(Monitor.url, Monitor.frequency, Monitor.is_active).where(
+                Monitor.user_id == user_id
+            ))
         )
-        monitors = result.scalars().all()
+        monitors = result.all()
 
     if not monitors:
         await update.message.reply_text("You are not monitoring any URLs.")
         return
 
     msg = "**Your Monitored Pages:**\n"
-    for m in monitors:
-        status = "✅ Active" if m.is_active else "❌ Inactive"
-        msg += f"- {m.url} ({m.frequency}m) [{status}]\n"
+    for url, frequency, is_active in monitors:
+        status = "✅ Active" if is_active else "❌ Inactive"
+        msg += f"- {url} ({frequency}m) [{status}]\n"
         
     await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
 
 
 # --- Job Logic ---
 
+def get_monitor_cache(bot_data: dict) -> dict[int, PageState]:
+    """Returns the in-memory page state of active monitors, keyed by monitor id."""
+    return bot_data.setdefault("monitor_cache", {})
+
+
+class StoredPageState(Protocol):
+    """Page state columns, as found on a Monitor or a row selected from it."""
+
+    @property
+    def content_hash(self) -> Optional[bytes]: ...
+    @property
+    def raw_hash(self) -> Optional[bytes]: ...
+    @property
+    def etag(self) -> Optional[str]: ...
+    @property
+    def last_modified(self) -> Optional[str]: ...
+
+
+def get_page_state(monitor: StoredPageState) -> PageState:
+    """Returns the page state stored on a monitor or monitor row."""
+    return PageState(
+        content_hash=monitor.content_hash,
+        raw_hash=monitor.raw_hash,
+        etag=monitor.etag,
+        last_modified=monitor.last_modified,
+    )
+
+
 async def check_url_job(context: ContextTypes.DEFAULT_TYPE):
     """Job to check a specific URL."""
     if not context.job or not context.job.data:  # pragma: no cover
@@ -318,18 +399,22 @@ async def check_url_job(context: ContextTypes.DEFAULT_TYPE):
 
     logger.info(f"Checking {url} for user {user_id}")
 
-    # Fetch DB state
-    async with async_session() as session:
-        monitor = await session.get(Monitor, monitor_id)
-        if not monitor or not monitor.is_active:
-            # Monitor deleted or inactive, stop job
-            context.job.schedule_removal()
-            return
+    cache = get_monitor_cache(context.bot_data)
+    old_state = cache.get(monitor_id)
+    if old_state is None:
+        # Not cached: fetch DB state; the session is closed before fetching the page
+        async with async_session() as session:
+            monitor = await session.get(Monitor, monitor_id)
+            if not monitor or not monitor.is_active:
+                # Monitor deleted or inactive, stop job
+                context.job.schedule_removal()
+                return
 
-        old_hash = monitor.content_hash
+            old_state = get_page_state(monitor)
+        cache[monitor_id] = old_state
 
-    # Check for changes
-    new_hash, changed, summary = PageMonitor.check_for_changes(url, old_hash)
+    # Check for changes in a worker thread so a slow site does not block the event loop
+    new_state, changed, summary = await asyncio.to_thread(PageMonitor.check_for_changes, url, old_state)
 
     if changed:
         # Notify User
@@ -342,23 +427,23 @@ async def check_url_job(context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Failed to send notification to {user_id}: {e}")
 
-        # Update DB
+    # Save the new state on a change, the first run, or a cosmetic change to the raw page
+    if new_state != old_state:
         async with async_session() as session:
-            monitor = await session.get(Monitor, monitor_id)
-            if monitor:
-                monitor.content_hash = new_hash
-                monitor.last_checked = datetime.now()
-                await session.commit()
-    elif new_hash != old_hash:
-        # Update hash even if "not changed" (e.g. initial run) to be safe, 
-        # though PageMonitor logic handles the 'First Run' false return.
-        # If PageMonitor returns False but new_hash != old_hash (e.g. first run), we should save it.
-        async with async_session() as session:
-            monitor = await session.get(Monitor, monitor_id)
-            if monitor:
-                monitor.content_hash = new_hash
-                monitor.last_checked = datetime.now()
-                await session.commit()
+            # UPDATE statements return a CursorResult, which carries the rowcount
+            result = cast(CursorResult, await session.execute(
+                update(Monitor).where(Monitor.id == monitor_id).values(
+                    **new_state._asdict(),
+                    last_checked=datetime.now(),
+                )
+            ))
+            await session.commit()
+
+        if result.rowcount:
+            cache[monitor_id] = new_state
+        else:
+            # Monitor was deleted while the page was being checked
+            cache.pop(monitor_id, None)
 
 
 async def daily_report_job(context: ContextTypes.DEFAULT_TYPE):
@@ -366,19 +451,18 @@ async def daily_report_job(context: ContextTypes.DEFAULT_TYPE):
     if not ADMIN_CHAT_ID:
         return
 
-    async with async_session() as session:
-        # Get stats
-        total_monitors = await session.execute(select(Monitor))
-        total_monitors_count = len(total_monitors.scalars().all())
-        
-        active_monitors = await session.execute(select(Monitor).where(Monitor.is_active.is_(True)))
-        active_monitors_count = len(active_monitors.scalars().all())
+    # Get stats; each count runs concurrently in its own session
+    total_monitors_count, active_monitors_count = await asyncio.gather(
+        count_monitors(),
+        count_monitors(active_only=True),
+    )
 
     msg = (
         "📊 **Daily WebUpdateBot Report**\n\n"
         f"✅ Bot is alive and running.\n"
         f"Total Monitors: {total_monitors_count}\n"
         f"Active Monitors: {active_monitors_count}\n"
+        f"DB Pool: {get_pool_status()}\n"
         f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
@@ -388,15 +472,20 @@ async def daily_report_job(context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Failed to send admin report: {e}")
 
 
-def schedule_monitor_job(application, monitor_id, url, user_id, interval):
+def schedule_monitor_job(application, monitor_id, url, user_id, interval, first=FIRST_CHECK_DELAY):
     """Schedules a repeating job for a monitor."""
     # Ensure no duplicates
     remove_jobs_by_name(application, str(monitor_id))
     
+    add_monitor_job(application, monitor_id, url, user_id, interval, first)
+
+
+def add_monitor_job(application, monitor_id, url, user_id, interval, first=FIRST_CHECK_DELAY):
+    """Adds a repeating job for a monitor without checking for an existing one."""
     application.job_queue.run_repeating(
         check_url_job,
         interval=interval * 60,
-        first=10, # Wait 10s before first check to avoid startup spikes
+        first=first,
         data={"url": url, "user_id": user_id, "monitor_id": monitor_id}, # type: ignore
         name=str(monitor_id)
     )
@@ -413,17 +502,26 @@ async def restore_jobs(application: Application):
     """Restores all active monitors from DB on startup."""
     logger.info("Restoring jobs from database...")
     monitors = await get_all_active_monitors()
+    cache = get_monitor_cache(application.bot_data)
     count = 0
-    for m in monitors:
-        schedule_monitor_job(application, m.id, m.url, m.user_id, m.frequency)
+    # Stagger first checks across the restore window so monitors don't all fire
+    # together and keep distinct phases on later runs.
+    # The job queue is still empty at startup, so the per-job duplicate scan is skipped.
+    for i, m in enumerate(monitors):
+        first = FIRST_CHECK_DELAY + i * RESTORE_SPREAD / len(monitors)
+        add_monitor_job(application, m.id, m.url, m.user_id, m.frequency, first=first)
+        cache[m.id] = get_page_state(m)
         count += 1
     logger.info(f"Restored {count} monitoring jobs.")
 
 
 async def post_init(application: Application):
     """Post initialization hook."""
+    # Run new tasks eagerly until their first suspension; most handlers and jobs
+    # return or hit a ready await before ever needing a scheduler round-trip
+    asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     await init_db()
-    await restore_jobs(application)
     
     # Set bot commands
     commands = [
@@ -434,7 +532,11 @@ async def post_init(application: Application):
         BotCommand("update", "Update frequency"),
         BotCommand("help", "Show available commands"),
     ]
-    await application.bot.set_my_commands(commands)
+
+    # Restoring jobs only needs the database, so it overlaps with the Telegram call
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(restore_jobs(application))
+        tg.create_task(application.bot.set_my_commands(commands))
 
 
 def main():  # pragma: no cover
@@ -442,11 +544,23 @@ def main():  # pragma: no cover
         logger.error("TELEGRAM_BOT_TOKEN not set!")
         sys.exit(1)
 
+    # Use the libuv event loop when available; run_polling creates its loop from this policy
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     # Build Application
     application = (
         ApplicationBuilder()
         .token(TOKEN)
         .post_init(post_init)
+        # Throttle bursts of notifications and retry when Telegram asks us to slow down
+        .rate_limiter(
+            AIORateLimiter(
+                overall_max_rate=TELEGRAM_MAX_RATE,
+                overall_time_period=1,
+                max_retries=TELEGRAM_MAX_RETRIES,
+            )
+        )
         .build()
     )
 
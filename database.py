@@ -1,14 +1,34 @@
+import logging
 import os
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, Boolean, DateTime, Integer, String, select
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    delete,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    event,
+    func,
+    inspect,
+    lambda_stmt,
+    select,
+    text,
+    update,
+)
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
 
 # Ensure data directory exists if using file-based DB
 
@@ -18,7 +38,52 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///data/bot_database.
 if "sqlite" in DATABASE_URL and "/data/" in DATABASE_URL:
     os.makedirs("data", exist_ok=True)  # pragma: no cover
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Page hashes are stored as raw xxh3 128-bit digests
+HASH_SIZE = 16
+
+
+def _engine_options(database_url: str) -> dict:
+    """Returns the connection pool options for the given database URL."""
+    if "sqlite" in database_url and ":memory:" in database_url:
+        # In-memory databases live in a single static connection
+        return {}
+
+    options = {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if "sqlite" in database_url:
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        # Reuse the most recently returned connection so idle overflow drains
+        options["pool_use_lifo"] = True
+        options["pool_pre_ping"] = True
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tunes each new SQLite connection for concurrent reads and cheap commits."""
+    cursor = dbapi_connection.cursor()
+    # Readers no longer block on the writer, and commits skip most fsyncs
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+    cursor.close()
+
+
+engine = create_async_engine(DATABASE_URL, echo=False, **_engine_options(DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+# Sessions must not stay open across network I/O (page fetches, Telegram calls):
+# with SQLite an open write transaction blocks every other writer
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 
@@ -28,27 +93,106 @@ class Base(AsyncAttrs, DeclarativeBase):
 
 class Monitor(Base):
     __tablename__ = "monitors"
+    __table_args__ = (
+        Index("ix_monitor_user_url", "user_id", "url", unique=True),
+        Index("ix_monitor_active", "is_active"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
     url: Mapped[str] = mapped_column(String)
     frequency: Mapped[int] = mapped_column(Integer, default=60)  # in minutes
     last_checked: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
-    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    content_hash: Mapped[Optional[bytes]] = mapped_column(LargeBinary(HASH_SIZE), nullable=True)
+    raw_hash: Mapped[Optional[bytes]] = mapped_column(LargeBinary(HASH_SIZE), nullable=True)
+    etag: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    last_modified: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
 
     def __repr__(self) -> str:
         return f"<Monitor(user_id={self.user_id}, url='{self.url}', freq={self.frequency})>"
 
 
+def _remove_duplicate_monitors(connection):
+    """Keeps only the oldest monitor for each (user_id, url) so the unique index can be built."""
+    oldest_ids = select(func.min(Monitor.id)).group_by(Monitor.user_id, Monitor.url)
+    duplicates = connection.execute(
+        select(Monitor.id, Monitor.user_id, Monitor.url).where(Monitor.id.not_in(oldest_ids)).order_by(Monitor.id)
+    ).all()
+    if not duplicates:
+        return
+
+    logger.warning(
+        f"Removing {len(duplicates)} duplicate monitor(s) before creating the unique (user_id, url) index: "
+        f"{[tuple(row) for row in duplicates]}"
+    )
+    connection.execute(delete(Monitor).where(Monitor.id.in_([row.id for row in duplicates])))
+
+
+def _upgrade_schema(connection):
+    """Brings tables created by earlier versions up to date."""
+    table = Base.metadata.tables[Monitor.__tablename__]
+    existing_columns = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing_columns:
+            column_type = column.type.compile(connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    existing_indexes = {index["name"] for index in inspect(connection).get_indexes(table.name)}
+    if "ix_monitor_user_url" not in existing_indexes:
+        _remove_duplicate_monitors(connection)
+
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+    # Hashes are stored as raw 16-byte xxh3 digests; drop older hex-encoded ones
+    # (xxh3 or sha256) so the next check records a fresh baseline instead of
+    # reporting a change
+    for column in (Monitor.content_hash, Monitor.raw_hash):
+        connection.execute(
+            update(Monitor).where(func.length(column) != HASH_SIZE).values({column: None})
+        )
+
+
 async def init_db():
     """Initializes the database tables."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
 
 
 async def get_all_active_monitors():
-    """Retrieves all active monitors."""
+    """
+    Retrieves all active monitors.
+    Returns plain rows with only the columns needed to schedule jobs, which are
+    much lighter than identity-mapped ORM instances.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            lambda_stmt(lambda: select(
+                Monitor.id,
+                Monitor.user_id,
+                Monitor.url,
+                Monitor.frequency,
+                Monitor.content_hash,
+                Monitor.raw_hash,
+                Monitor.etag,
+                Monitor.last_modified,
+            ).where(Monitor.is_active.is_(True)))
+        )
+        return result.all()
+
+
+def get_pool_status() -> str:
+    """Returns a summary of the connection pool usage."""
+    return engine.pool.status()
+
+
+async def count_monitors(active_only: bool = False) -> int:
+    """Counts monitors, optionally only the active ones."""
+    stmt = select(func.count()).select_from(Monitor)
+    if active_only:
+        stmt = stmt.where(Monitor.is_active.is_(True))
     async with async_session() as session:
-        result = await session.execute(select(Monitor).where(Monitor.is_active.is_(True)))
-        return result.scalars().all()
+        result = await session.execute(stmt)
+        return result.scalar_one()
@@ -1,11 +1,35 @@
-import hashlib
+import http.cookiejar
 import logging
 import requests
-from bs4 import BeautifulSoup
-from typing import Optional, Tuple
+import xxhash
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser
+from typing import NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Elements whose content is not page text (strip_tags only accepts a list)
+_JUNK_TAGS = ["script", "style", "meta", "noscript"]
+
+# Shared by all checks so repeat fetches reuse open TCP/TLS connections.
+# Sized for the default thread pool the bot fetches from.
+_HTTP_POOL_SIZE = 32
+_SESSION = requests.Session()
+# Never store cookies: each fetch must see the page as a fresh visitor would,
+# independent of what other monitors (or users) fetched before
+_SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+for _prefix in ("http://", "https://"):
+    _SESSION.mount(_prefix, HTTPAdapter(pool_connections=_HTTP_POOL_SIZE, pool_maxsize=_HTTP_POOL_SIZE))
+
+
+class PageState(NamedTuple):
+    """Fingerprints of the last fetched version of a page."""
+
+    content_hash: Optional[bytes] = None  # Hash of the cleaned text
+    raw_hash: Optional[bytes] = None  # Hash of the raw response body
+    etag: Optional[str] = None  # ETag response header
+    last_modified: Optional[str] = None  # Last-Modified response header
+
 
 class PageMonitor:
     """
@@ -13,20 +37,35 @@ class PageMonitor:
     """
 
     @staticmethod
-    def fetch_content(url: str) -> Optional[str]:
-        """Fetches the page content."""
+    def fetch_page(
+        url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> Optional[requests.Response]:
+        """
+        Fetches the page and returns the response.
+        When validators are given the request is conditional and may return 304 Not Modified.
+        """
         try:
             # Added a user agent to avoid being blocked by some sites
             headers = {
                 "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
             }
-            response = requests.get(url, headers=headers, timeout=15)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            response = _SESSION.get(url, headers=headers, timeout=15)
             response.raise_for_status()
-            return response.text
+            return response
         except requests.RequestException as e:
             logger.error(f"Error fetching URL {url}: {e}")
             return None
 
+    @classmethod
+    def fetch_content(cls, url: str) -> Optional[str]:
+        """Fetches the page content."""
+        response = cls.fetch_page(url)
+        return response.text if response is not None else None
+
     @staticmethod
     def clean_content(html_content: str) -> str:
         """
@@ -35,39 +74,64 @@ class PageMonitor:
         """
         if not html_content:
             return ""
-        soup = BeautifulSoup(html_content, "html.parser")
+        tree = LexborHTMLParser(html_content)
+        if tree.root is None:
+            return ""
 
         # Remove script and style elements
-        for script_or_style in soup(["script", "style", "meta", "noscript"]):
-            script_or_style.decompose()
+        tree.strip_tags(_JUNK_TAGS)
 
         # Get text content
-        text = soup.get_text(separator=" ", strip=True)
+        text = tree.root.text(separator=" ", strip=True)
         return text
 
     @staticmethod
-    def get_content_hash(text: str) -> str:
-        """Returns sha256 hash of the text."""
-        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    def get_content_hash(text: str) -> bytes:
+        """
+        Returns the raw xxh3 128-bit digest of the text.
+        Only used to detect changes, so a non-cryptographic hash is enough.
+        """
+        return xxhash.xxh3_128_digest(text.encode("utf-8"))
+
+    @staticmethod
+    def get_raw_hash(content: bytes) -> bytes:
+        """Returns the raw xxh3 128-bit digest of the page bytes."""
+        return xxhash.xxh3_128_digest(content)
 
     @classmethod
-    def check_for_changes(cls, url: str, old_hash: Optional[str]) -> Tuple[Optional[str], bool, str]:
+    def check_for_changes(cls, url: str, old_state: PageState) -> Tuple[PageState, bool, str]:
         """
         Checks for changes.
-        Returns: (new_hash, changed, summary)
+        Returns: (new_state, changed, summary)
         """
-        html = cls.fetch_content(url)
-        if not html:
-            return old_hash, False, "Failed to fetch content."
+        # Only revalidate once there is a baseline to compare against
+        if old_state.content_hash is not None:
+            response = cls.fetch_page(url, old_state.etag, old_state.last_modified)
+        else:
+            response = cls.fetch_page(url)
+
+        if response is not None and response.status_code == 304:
+            return old_state, False, "No changes."
+        if response is None or not response.content:
+            return old_state, False, "Failed to fetch content."
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        # Byte-identical page: skip parsing and cleaning altogether
+        raw_hash = cls.get_raw_hash(response.content)
+        if old_state.content_hash is not None and raw_hash == old_state.raw_hash:
+            return old_state._replace(etag=etag, last_modified=last_modified), False, "No changes."
 
-        text = cls.clean_content(html)
+        text = cls.clean_content(response.text)
         new_hash = cls.get_content_hash(text)
+        new_state = PageState(content_hash=new_hash, raw_hash=raw_hash, etag=etag, last_modified=last_modified)
 
-        if old_hash is None:
+        if old_state.content_hash is None:
             # First run
-            return new_hash, False, "Initial check. Monitoring started."
+            return new_state, False, "Initial check. Monitoring started."
 
-        if new_hash != old_hash:
+        if new_hash != old_state.content_hash:
             # Change detected
             # Try to infer what changed (basic length check)
             # In a real diff implementation, we would compare stored text vs new text,
@@ -78,6 +142,6 @@ class PageMonitor:
             # Could download "last version" if we stored it, but we don't.
             # length_diff = len(text)  # We can't know the old length from hash.
             summary = f"Content changed. New content length: {len(text)} characters."
-            return new_hash, True, summary
+            return new_state, True, summary
 
-        return new_hash, False, "No changes."
+        return new_state, False, "No changes."
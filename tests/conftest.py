@@ -0,0 +1,10 @@
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None  # type: ignore[assignment]
+
+if uvloop is not None:
+
+    def pytest_asyncio_loop_factories(config, item):
+        """Run the async tests on uvloop, like the bot itself."""
+        return {"uvloop": uvloop.new_event_loop}
@@ -1,5 +1,8 @@
+import asyncio
+import threading
+from types import SimpleNamespace as NS
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock
 from bot import (
     start, follow_start, follow_url_input, follow_freq_input,
     remove_start, remove_confirm,
@@ -7,41 +10,53 @@ from bot import (
     check_url_job, list_monitors,
     FOLLOW_URL, FOLLOW_FREQ, REMOVE_SELECT, UPDATE_SELECT, UPDATE_FREQ
 )
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram.ext import ConversationHandler
 import bot
+from monitor import PageState
+
+# Mock the database setup, built once: AsyncMock construction is not free.
+# The spec makes sync session methods (add) plain MagicMocks.
+_SESSION = AsyncMock(spec=AsyncSession)
+_RESULT = MagicMock()
+_SCALARS = MagicMock()
+_SESSION_CTX = AsyncMock()
+_SESSION_MAKER = MagicMock(return_value=_SESSION_CTX)
 
-# Mock the database setup
 @pytest.fixture
 async def mock_db(monkeypatch):
-    # Mock session
-    mock_session = AsyncMock()
+    # Forget calls and anything the previous test configured, then re-wire
+    for mock in (_SESSION, _RESULT, _SCALARS, _SESSION_CTX.__aenter__, _SESSION_CTX.__aexit__):
+        mock.reset_mock(return_value=True, side_effect=True)
+    _SESSION_MAKER.reset_mock()
+
     # Configure execute return value (Result)
-    mock_result = MagicMock()
-    mock_session.execute.return_value = mock_result
+    _SESSION.execute.return_value = _RESULT
     # Configure scalars (Result.scalars() is sync)
-    mock_scalars = MagicMock()
-    mock_result.scalars.return_value = mock_scalars
-    
-    mock_session_ctx = AsyncMock()
-    mock_session_ctx.__aenter__.return_value = mock_session
-    mock_session_ctx.__aexit__.return_value = None
-    
-    mock_session_maker = MagicMock(return_value=mock_session_ctx)
-    
-    monkeypatch.setattr(bot, "async_session", mock_session_maker)
-    return mock_session
+    _RESULT.scalars.return_value = _SCALARS
+    # UPDATE statements touch one row unless a test says otherwise
+    _RESULT.rowcount = 1
+
+    _SESSION_CTX.__aenter__.return_value = _SESSION
+    _SESSION_CTX.__aexit__.return_value = None
+
+    monkeypatch.setattr(bot, "async_session", _SESSION_MAKER)
+    return _SESSION
+
+def _reply_text(update):
+    """Text of the last message the handler replied with."""
+    return update.message.reply_text.call_args.args[0]
 
-@pytest.mark.asyncio
 async def test_start(mock_db):
     update = AsyncMock()
     context = MagicMock()
     await start(update, context)
     update.message.reply_text.assert_called_once()
-    assert "WebUpdateBot" in update.message.reply_text.call_args[0][0]
-    assert "/remove` - Stop monitoring" in update.message.reply_text.call_args[0][0]
-    assert "/update` - Change check frequency" in update.message.reply_text.call_args[0][0]
+    text = _reply_text(update)
+    assert "WebUpdateBot" in text
+    assert "/remove` - Stop monitoring" in text
+    assert "/update` - Change check frequency" in text
 
-@pytest.mark.asyncio
 async def test_follow_args_rejected():
     update = AsyncMock()
     context = MagicMock()
@@ -50,31 +65,29 @@ async def test_follow_args_rejected():
     state = await follow_start(update, context)
     
     assert state == ConversationHandler.END
-    assert "Please use the interactive mode" in update.message.reply_text.call_args[0][0]
+    assert "Please use the interactive mode" in _reply_text(update)
 
 # --- Follow Conversation Tests ---
 
-@pytest.mark.asyncio
 async def test_follow_start():
     update = AsyncMock()
     context = MagicMock()
     context.args = []
     state = await follow_start(update, context)
     assert state == FOLLOW_URL
-    assert "Please send me the **URL**" in update.message.reply_text.call_args[0][0]
+    assert "Please send me the **URL**" in _reply_text(update)
 
-@pytest.mark.asyncio
-async def test_follow_url_input_invalid():
+@pytest.mark.parametrize("text", ["ftp://bad.com", "httpbad.com", "http://", "http://bad .com"])
+async def test_follow_url_input_invalid(text):
     update = AsyncMock()
-    update.message.text = "ftp://bad.com"
+    update.message.text = text
     context = MagicMock()
     state = await follow_url_input(update, context)
     assert state == FOLLOW_URL
-    assert "Invalid URL" in update.message.reply_text.call_args[0][0]
+    assert "Invalid URL" in _reply_text(update)
 
-@pytest.mark.asyncio
-@patch("bot.PageMonitor.fetch_content", return_value="<html>ok</html>")
-async def test_follow_url_input_valid(mock_fetch, mock_db):
+async def test_follow_url_input_valid(mock_db, monkeypatch):
+    monkeypatch.setattr(bot.PageMonitor, "fetch_content", MagicMock(return_value="<html>ok</html>"))
     update = AsyncMock()
     update.message.text = "http://good.com"
     context = MagicMock()
@@ -90,86 +103,118 @@ async def test_follow_url_input_valid(mock_fetch, mock_db):
     status_msg = update.message.reply_text.return_value
     status_msg.edit_text.assert_called()
 
-@pytest.mark.asyncio
-async def test_follow_freq_input_success(mock_db):
+async def test_follow_freq_input_success(mock_db, monkeypatch):
     update = AsyncMock()
     update.message.text = "30"
     update.effective_chat.id = 123
     context = MagicMock()
+    context.bot_data = {}
     context.user_data = {"follow_url": "http://u.com", "follow_content": "ok"}
     
     # Mock DB: no existing monitor
     mock_db.execute.return_value.scalars.return_value.first.return_value = None
     
-    with patch("bot.PageMonitor.get_content_hash", return_value="hash"):
-        with patch("bot.schedule_monitor_job") as mock_schedule:
-            state = await follow_freq_input(update, context)
+    threads = []
+
+    def fake_clean(html):
+        threads.append(threading.current_thread())
+        return html
+
+    mock_schedule = MagicMock()
+    monkeypatch.setattr(bot.PageMonitor, "get_content_hash", MagicMock(return_value=b"hash"))
+    monkeypatch.setattr(bot.PageMonitor, "clean_content", fake_clean)
+    monkeypatch.setattr(bot, "schedule_monitor_job", mock_schedule)
+
+    state = await follow_freq_input(update, context)
             
     assert state == ConversationHandler.END
     mock_db.add.assert_called_once()
     mock_db.commit.assert_called_once()
     mock_schedule.assert_called_once()
+    assert list(context.bot_data["monitor_cache"].values()) == [PageState(b"hash")]
+    assert threads and threads[0] is not threading.main_thread()
 
 # --- Remove Conversation Tests ---
 
-@pytest.mark.asyncio
 async def test_remove_start_no_monitors(mock_db):
     update = AsyncMock()
     update.effective_chat.id = 123
     context = MagicMock()
     # Return empty list
-    mock_db.execute.return_value.scalars.return_value.all.return_value = []
+    mock_db.execute.return_value.all.return_value = []
     
     state = await remove_start(update, context)
     assert state == ConversationHandler.END
-    assert "no active monitors" in update.message.reply_text.call_args[0][0]
+    assert "no active monitors" in _reply_text(update)
 
-@pytest.mark.asyncio
 async def test_remove_start_with_monitors(mock_db):
     update = AsyncMock()
     update.effective_chat.id = 123
     context = MagicMock()
     
-    m = MagicMock(id=1, url="u", frequency=60)
-    mock_db.execute.return_value.scalars.return_value.all.return_value = [m]
+    mock_db.execute.return_value.all.return_value = [(1, "u", 60)]
     
     state = await remove_start(update, context)
     assert state == REMOVE_SELECT
     # Check reply_markup (InlineKeyboardMarkup)
     assert update.message.reply_text.call_args[1]["reply_markup"] is not None
 
-@pytest.mark.asyncio
-async def test_remove_confirm(mock_db):
+async def test_monitor_keyboard_is_reused(mock_db):
+    mock_db.execute.return_value.all.return_value = [(1, "u", 60)]
+    first = await bot.get_monitor_keyboard(123)
+    second = await bot.get_monitor_keyboard(123)
+    assert first is second
+    assert first.inline_keyboard[0][0].callback_data == "1"
+
+async def test_remove_confirm(mock_db, monkeypatch):
     update = AsyncMock()
     update.effective_chat.id = 123
     query = update.callback_query
     query.data = "1"
     context = MagicMock()
+    context.bot_data = {"monitor_cache": {1: PageState(b"old")}}
     
-    m = MagicMock(id=1, user_id=123, url="u")
+    m = NS(id=1, user_id=123, url="u")
     mock_db.get.return_value = m
     
-    with patch("bot.remove_jobs_by_name") as mock_rm_job:
-        state = await remove_confirm(update, context)
+    mock_rm_job = MagicMock()
+    monkeypatch.setattr(bot, "remove_jobs_by_name", mock_rm_job)
+
+    state = await remove_confirm(update, context)
         
     assert state == ConversationHandler.END
     mock_db.delete.assert_called_with(m)
     mock_rm_job.assert_called_with(context.application, "1")
+    assert context.bot_data["monitor_cache"] == {}
+
+async def test_remove_confirm_replies_after_session_closed(mock_db, monkeypatch):
+    update = AsyncMock()
+    update.effective_chat.id = 123
+    query = update.callback_query
+    query.data = "1"
+    context = MagicMock()
+    mock_db.get.return_value = NS(id=1, user_id=123, url="u")
+    events = []
+    _SESSION_CTX.__aexit__.side_effect = lambda *args: events.append("closed")
+    query.edit_message_text.side_effect = lambda *args, **kwargs: events.append("reply")
+    
+    monkeypatch.setattr(bot, "remove_jobs_by_name", MagicMock())
+
+    await remove_confirm(update, context)
+        
+    assert events == ["closed", "reply"]
 
 # --- Update Conversation Tests ---
 
-@pytest.mark.asyncio
 async def test_update_start(mock_db):
     update = AsyncMock()
     update.effective_chat.id = 123
     context = MagicMock()
-    m = MagicMock(id=1, url="u", frequency=60)
-    mock_db.execute.return_value.scalars.return_value.all.return_value = [m]
+    mock_db.execute.return_value.all.return_value = [(1, "u", 60)]
     
     state = await update_start(update, context)
     assert state == UPDATE_SELECT
 
-@pytest.mark.asyncio
 async def test_update_ask_freq(mock_db):
     update = AsyncMock()
     query = update.callback_query
@@ -181,19 +226,20 @@ async def test_update_ask_freq(mock_db):
     assert state == UPDATE_FREQ
     assert context.user_data["update_monitor_id"] == 1
 
-@pytest.mark.asyncio
-async def test_update_save(mock_db):
+async def test_update_save(mock_db, monkeypatch):
     update = AsyncMock()
     update.message.text = "120"
     update.effective_chat.id = 123
     context = MagicMock()
     context.user_data = {"update_monitor_id": 1}
     
-    m = MagicMock(id=1, user_id=123, url="u")
+    m = NS(id=1, user_id=123, url="u")
     mock_db.get.return_value = m
     
-    with patch("bot.schedule_monitor_job") as mock_schedule:
-        state = await update_save(update, context)
+    mock_schedule = MagicMock()
+    monkeypatch.setattr(bot, "schedule_monitor_job", mock_schedule)
+
+    state = await update_save(update, context)
         
     assert state == ConversationHandler.END
     assert m.frequency == 120
@@ -202,57 +248,180 @@ async def test_update_save(mock_db):
 
 # --- Job/Other Tests ---
 
-@pytest.mark.asyncio
-async def test_check_url_job(mock_db):
+async def test_check_url_job(mock_db, monkeypatch):
     context = MagicMock()
+    context.bot_data = {}
     context.job.data = {"url": "u", "user_id": 1, "monitor_id": 1}
-    m = MagicMock(is_active=True, content_hash="old")
+    m = NS(is_active=True, content_hash=b"old", raw_hash=b"oldraw", etag=None, last_modified=None)
     mock_db.get.return_value = m
     
-    with patch("bot.PageMonitor.check_for_changes", return_value=("new", True, "chg")):
-        await check_url_job(context)
+    monkeypatch.setattr(
+        bot.PageMonitor, "check_for_changes", MagicMock(return_value=(PageState(b"new", b"newraw"), True, "chg"))
+    )
+
+    await check_url_job(context)
         
     context.bot.send_message.assert_called_once()
     mock_db.commit.assert_called_once()
+    params = mock_db.execute.call_args.args[0].compile().params
+    assert params["content_hash"] == b"new"
+    assert params["raw_hash"] == b"newraw"
+    assert context.bot_data["monitor_cache"][1] == PageState(b"new", b"newraw")
+
+async def test_check_url_job_uses_cached_state(mock_db, monkeypatch):
+    context = MagicMock()
+    context.bot_data = {"monitor_cache": {1: PageState(b"old")}}
+    context.job.data = {"url": "u", "user_id": 1, "monitor_id": 1}
+    
+    mock_check = MagicMock(return_value=(PageState(b"old"), False, "No changes."))
+    monkeypatch.setattr(bot.PageMonitor, "check_for_changes", mock_check)
+
+    await check_url_job(context)
+        
+    mock_check.assert_called_once_with("u", PageState(b"old"))
+    mock_db.get.assert_not_called()
+    mock_db.commit.assert_not_called()
+
+async def test_check_url_job_monitor_deleted(mock_db):
+    context = MagicMock()
+    context.bot_data = {}
+    context.job.data = {"url": "u", "user_id": 1, "monitor_id": 1}
+    mock_db.get.return_value = None
+    
+    await check_url_job(context)
+        
+    context.job.schedule_removal.assert_called_once()
+    assert context.bot_data["monitor_cache"] == {}
+
+async def test_check_url_job_runs_check_off_loop(mock_db, monkeypatch):
+    context = MagicMock()
+    context.bot_data = {}
+    context.job.data = {"url": "u", "user_id": 1, "monitor_id": 1}
+    mock_db.get.return_value = NS(is_active=True, content_hash=b"old", raw_hash=None, etag=None, last_modified=None)
+    threads = []
+
+    def fake_check(url, old_state):
+        threads.append(threading.current_thread())
+        return old_state, False, "No changes."
+
+    monkeypatch.setattr(bot.PageMonitor, "check_for_changes", fake_check)
+
+    await check_url_job(context)
+
+    assert threads and threads[0] is not threading.main_thread()
+    context.bot.send_message.assert_not_called()
+    mock_db.commit.assert_not_called()
+
+async def test_check_url_jobs_fetch_concurrently(mock_db, monkeypatch):
+    # Both checks must be in flight at once for the barrier to release
+    barrier = threading.Barrier(2, timeout=5)
+    shared_bot = AsyncMock()
+    bot_data = {"monitor_cache": {1: PageState(b"old1"), 2: PageState(b"old2")}}
+
+    def fake_check(url, old_state):
+        barrier.wait()
+        return PageState(b"new"), True, "chg"
+
+    monkeypatch.setattr(bot.PageMonitor, "check_for_changes", fake_check)
+
+    contexts = []
+    for monitor_id in (1, 2):
+        context = MagicMock(bot=shared_bot, bot_data=bot_data)
+        context.job.data = {"url": f"http://{monitor_id}.com", "user_id": monitor_id, "monitor_id": monitor_id}
+        contexts.append(context)
+
+    await asyncio.gather(*(check_url_job(context) for context in contexts))
+
+    assert sorted(c.kwargs["chat_id"] for c in shared_bot.send_message.call_args_list) == [1, 2]
 
-@pytest.mark.asyncio
 async def test_list_monitors(mock_db):
     update = AsyncMock()
     context = MagicMock()
     update.effective_chat.id = 123
-    mock_db.execute.return_value.scalars.return_value.all.return_value = []
+    mock_db.execute.return_value.all.return_value = []
+    await list_monitors(update, context)
+    assert "not monitoring any URLs" in _reply_text(update)
+
+async def test_list_monitors_with_monitors(mock_db):
+    update = AsyncMock()
+    context = MagicMock()
+    update.effective_chat.id = 123
+    mock_db.execute.return_value.all.return_value = [("http://a.com", 30, True), ("http://b.com", 60, False)]
     await list_monitors(update, context)
-    assert "not monitoring any URLs" in update.message.reply_text.call_args[0][0]
+    msg = _reply_text(update)
+    assert "- http://a.com (30m) [✅ Active]" in msg
+    assert "- http://b.com (60m) [❌ Inactive]" in msg
 
-@pytest.mark.asyncio
-async def test_post_init(mock_db):
+async def test_post_init(mock_db, monkeypatch):
     app = MagicMock()
     app.bot.set_my_commands = AsyncMock()
-    with patch("bot.init_db", new_callable=AsyncMock), patch("bot.restore_jobs", new_callable=AsyncMock):
+    mock_init = AsyncMock()
+    mock_restore = AsyncMock()
+    monkeypatch.setattr(bot, "init_db", mock_init)
+    monkeypatch.setattr(bot, "restore_jobs", mock_restore)
+
+    # The loop is shared by the whole session, so always undo post_init's task factory
+    loop = asyncio.get_running_loop()
+    task_factory = loop.get_task_factory()
+    try:
         await bot.post_init(app)
-        app.bot.set_my_commands.assert_called_once()
+        assert loop.get_task_factory() is asyncio.eager_task_factory
+    finally:
+        loop.set_task_factory(task_factory)
+
+    mock_init.assert_awaited_once()
+    mock_restore.assert_awaited_once_with(app)
+    app.bot.set_my_commands.assert_awaited_once()
 
-@pytest.mark.asyncio
-async def test_daily_report_job(mock_db):
+async def test_daily_report_job(mock_db, monkeypatch):
     context = MagicMock()
     # Mock admin chat id
-    with patch("bot.ADMIN_CHAT_ID", "123"):
-        # Mock monitors
-        mock_db.execute.return_value.scalars.return_value.all.return_value = [MagicMock(), MagicMock()]
-        await bot.daily_report_job(context)
-        context.bot.send_message.assert_called_once()
-        assert "Total Monitors: 2" in context.bot.send_message.call_args[1]["text"]
-
-@pytest.mark.asyncio
-async def test_restore_jobs(mock_db):
+    monkeypatch.setattr(bot, "ADMIN_CHAT_ID", "123")
+    # Mock monitor counts
+    monkeypatch.setattr(bot, "count_monitors", AsyncMock(side_effect=[2, 1]))
+
+    await bot.daily_report_job(context)
+
+    context.bot.send_message.assert_called_once()
+    assert "Total Monitors: 2" in context.bot.send_message.call_args[1]["text"]
+    assert "Active Monitors: 1" in context.bot.send_message.call_args[1]["text"]
+    assert "DB Pool:" in context.bot.send_message.call_args[1]["text"]
+
+async def test_restore_jobs(mock_db, monkeypatch):
+    app = MagicMock()
+    app.bot_data = {}
+    m = NS(id=1, url="u", user_id=1, frequency=60, content_hash=b"h", raw_hash=None, etag=None, last_modified=None)
+    mock_rm_job = MagicMock()
+    monkeypatch.setattr(bot, "get_all_active_monitors", AsyncMock(return_value=[m]))
+    monkeypatch.setattr(bot, "remove_jobs_by_name", mock_rm_job)
+
+    await bot.restore_jobs(app)
+
+    app.job_queue.run_repeating.assert_called_once()
+    mock_rm_job.assert_not_called()
+    assert app.bot_data["monitor_cache"] == {1: PageState(b"h")}
+
+async def test_restore_jobs_staggers_first_run(mock_db, monkeypatch):
     app = MagicMock()
-    m = MagicMock(id=1, url="u", user_id=1, frequency=60)
-    with patch("bot.get_all_active_monitors", return_value=[m]):
-        with patch("bot.schedule_monitor_job") as mock_schedule:
-            await bot.restore_jobs(app)
-            mock_schedule.assert_called_once()
+    monitors = [
+        NS(id=i, url="u", user_id=1, frequency=60, content_hash=None, raw_hash=None, etag=None, last_modified=None)
+        for i in range(4)
+    ]
+    monkeypatch.setattr(bot, "get_all_active_monitors", AsyncMock(return_value=monitors))
+
+    await bot.restore_jobs(app)
+    firsts = [c.kwargs["first"] for c in app.job_queue.run_repeating.call_args_list]
+    assert firsts == [10, 25, 40, 55]
+
+async def test_schedule_monitor_job_replaces_existing():
+    app = MagicMock()
+    job = MagicMock()
+    app.job_queue.get_jobs_by_name.return_value = [job]
+    bot.schedule_monitor_job(app, 1, "u", 1, 60)
+    job.schedule_removal.assert_called_once()
+    assert app.job_queue.run_repeating.call_args.kwargs["interval"] == 3600
+    assert app.job_queue.run_repeating.call_args.kwargs["name"] == "1"
 
-@pytest.mark.asyncio
 async def test_remove_jobs_by_name():
     app = MagicMock()
     job = MagicMock()
@@ -261,62 +430,81 @@ async def test_remove_jobs_by_name():
     job.schedule_removal.assert_called_once()
 
 
-@pytest.mark.asyncio
 async def test_cancel():
     update = AsyncMock()
     context = MagicMock()
     state = await bot.cancel(update, context)
     assert state == ConversationHandler.END
-    assert "cancelled" in update.message.reply_text.call_args[0][0]
+    assert "cancelled" in _reply_text(update)
 
-@pytest.mark.asyncio
-async def test_follow_freq_input_invalid_number():
+@pytest.mark.parametrize(
+    "handler, text, message, expected_state",
+    [
+        (follow_freq_input, "abc", "valid number", FOLLOW_FREQ),
+        (follow_freq_input, "2", "Minimum interval", FOLLOW_FREQ),
+        (update_save, "abc", "valid number", UPDATE_FREQ),
+        (update_save, "2", "Minimum interval", UPDATE_FREQ),
+    ],
+    ids=["follow-not-a-number", "follow-too-small", "update-not-a-number", "update-too-small"],
+)
+async def test_frequency_validation(handler, text, message, expected_state):
     update = AsyncMock()
-    update.message.text = "abc"
+    update.message.text = text
     context = MagicMock()
-    state = await follow_freq_input(update, context)
-    assert state == FOLLOW_FREQ
-    assert "valid number" in update.message.reply_text.call_args[0][0]
+    state = await handler(update, context)
+    assert state == expected_state
+    assert message in _reply_text(update)
 
-@pytest.mark.asyncio
-async def test_follow_freq_input_too_small():
+async def test_remove_confirm_not_found(mock_db):
     update = AsyncMock()
-    update.message.text = "2"
+    query = update.callback_query
+    query.data = "999"
     context = MagicMock()
-    state = await follow_freq_input(update, context)
-    assert state == FOLLOW_FREQ
-    assert "Minimum interval" in update.message.reply_text.call_args[0][0]
+    
+    mock_db.get.return_value = None
+    
+    state = await remove_confirm(update, context)
+    assert state == ConversationHandler.END
+    assert "not found" in query.edit_message_text.call_args[0][0]
 
-@pytest.mark.asyncio
-async def test_update_save_invalid():
+async def test_update_save_not_found(mock_db):
     update = AsyncMock()
-    update.message.text = "abc"
+    update.message.text = "60"
     context = MagicMock()
+    context.user_data = {"update_monitor_id": 999}
+    
+    mock_db.get.return_value = None
+    
     state = await update_save(update, context)
-    assert state == UPDATE_FREQ
+    assert state == ConversationHandler.END
+    assert "not found" in _reply_text(update)
 
-@pytest.mark.asyncio
-async def test_remove_confirm_not_found(mock_db):
+async def test_remove_confirm_other_users_monitor(mock_db):
     update = AsyncMock()
+    update.effective_chat.id = 123
     query = update.callback_query
-    query.data = "999"
+    query.data = "1"
     context = MagicMock()
     
-    mock_db.get.return_value = None
+    mock_db.get.return_value = NS(id=1, user_id=456, url="u")
     
     state = await remove_confirm(update, context)
     assert state == ConversationHandler.END
     assert "not found" in query.edit_message_text.call_args[0][0]
+    mock_db.delete.assert_not_called()
 
-@pytest.mark.asyncio
-async def test_update_save_not_found(mock_db):
+async def test_update_save_other_users_monitor(mock_db):
     update = AsyncMock()
     update.message.text = "60"
+    update.effective_chat.id = 123
     context = MagicMock()
-    context.user_data = {"update_monitor_id": 999}
+    context.user_data = {"update_monitor_id": 1}
     
-    mock_db.get.return_value = None
+    m = NS(id=1, user_id=456, url="u", frequency=30)
+    mock_db.get.return_value = m
     
     state = await update_save(update, context)
     assert state == ConversationHandler.END
-    assert "not found" in update.message.reply_text.call_args[0][0]
+    assert "not found" in _reply_text(update)
+    assert m.frequency == 30
+    mock_db.commit.assert_not_called()
@@ -1,17 +1,37 @@
 import pytest
 import os
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from database import Base, Monitor, get_all_active_monitors
+from sqlalchemy.pool import StaticPool
+from database import Base, Monitor, count_monitors, get_all_active_monitors
 import database
 
 # Use in-memory database for tests
 os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///:memory:"
 
+def _test_pragmas(dbapi_connection, connection_record):
+    # Throwaway database: no durability needed on commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _memory_engine():
+    """In-memory engine whose sessions all share one persistent connection."""
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        echo=False,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    event.listen(engine.sync_engine, "connect", _test_pragmas)
+    return engine
+
 @pytest.fixture
 async def override_db():
-    """Overrides the database engine for tests."""
-    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    """Fresh database engine for tests that change the schema or call init_db."""
+    engine = _memory_engine()
     
     # Patch database.engine and async_session
     database.engine = engine
@@ -24,32 +44,174 @@ async def override_db():
     
     await engine.dispose()
 
-@pytest.mark.asyncio
-async def test_add_monitor(override_db):
+@pytest.fixture(scope="session")
+async def shared_engine():
+    """One in-memory engine with the schema created once for the whole run."""
+    engine = _memory_engine()
+
+    # pysqlite never emits BEGIN itself, so the outer transaction (and the
+    # SAVEPOINTs inside it) would not actually roll anything back.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    yield engine
+
+    await engine.dispose()
+
+@pytest.fixture
+async def db_session(shared_engine, monkeypatch):
+    """Runs the test inside a transaction that is rolled back on teardown."""
+    async with shared_engine.connect() as conn:
+        trans = await conn.begin()
+        # Commits inside the test only release a SAVEPOINT
+        session_maker = async_sessionmaker(
+            bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint"
+        )
+        monkeypatch.setattr(database, "async_session", session_maker)
+
+        async with session_maker() as session:
+            yield session
+
+        await trans.rollback()
+
+async def test_add_monitor(db_session):
+    monitor = Monitor(user_id=123, url="http://example.com", frequency=30)
+    db_session.add(monitor)
+    await db_session.commit()
+
+    result = await db_session.execute(select(Monitor))
+    monitors = result.scalars().all()
+    assert len(monitors) == 1
+    assert monitors[0].url == "http://example.com"
+    assert monitors[0].is_active is True
+
+async def test_get_all_active_monitors(db_session):
+    m1 = Monitor(user_id=1, url="http://a.com", is_active=True)
+    m2 = Monitor(user_id=2, url="http://b.com", is_active=False)
+    db_session.add_all([m1, m2])
+    await db_session.commit()
+
+    monitors = await get_all_active_monitors()
+    assert len(monitors) == 1
+    assert monitors[0].url == "http://a.com"
+    assert monitors[0].frequency == 60
+    assert not isinstance(monitors[0], Monitor)
+
+async def test_count_monitors(db_session):
+    db_session.add_all([
+        Monitor(user_id=1, url="http://a.com", is_active=True),
+        Monitor(user_id=2, url="http://b.com", is_active=False),
+    ])
+    await db_session.commit()
+
+    assert await count_monitors() == 2
+    assert await count_monitors(active_only=True) == 1
+
+async def test_init_db_adds_missing_indexes(override_db):
+    async with database.engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_monitor_user_url"))
+
+    await database.init_db()
+
+    async with database.engine.connect() as conn:
+        indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("monitors")})
+    assert {"ix_monitor_user_url", "ix_monitor_active"} <= indexes
+
+async def test_init_db_removes_duplicate_monitors(override_db, caplog):
+    async with database.engine.begin() as conn:
+        # Databases created before the unique index may hold duplicate monitors
+        await conn.execute(text("DROP INDEX ix_monitor_user_url"))
     async with database.async_session() as session:
-        monitor = Monitor(user_id=123, url="http://example.com", frequency=30)
-        session.add(monitor)
+        session.add_all([
+            Monitor(id=1, user_id=1, url="http://a.com", frequency=30),
+            Monitor(id=2, user_id=1, url="http://a.com", frequency=60),
+            Monitor(id=3, user_id=2, url="http://a.com"),
+        ])
         await session.commit()
 
-        result = await session.execute(select(Monitor))
-        monitors = result.scalars().all()
-        assert len(monitors) == 1
-        assert monitors[0].url == "http://example.com"
-        assert monitors[0].is_active is True 
-        assert monitors[0].is_active is True
+    with caplog.at_level("WARNING", logger="database"):
+        await database.init_db()
+
+    async with database.async_session() as session:
+        result = await session.execute(select(Monitor.id, Monitor.frequency).order_by(Monitor.id))
+        assert result.all() == [(1, 30), (3, 60)]
+    async with database.engine.connect() as conn:
+        indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("monitors")})
+    assert "ix_monitor_user_url" in indexes
+    assert [record.getMessage() for record in caplog.records] == [
+        "Removing 1 duplicate monitor(s) before creating the unique (user_id, url) index: [(2, 1, 'http://a.com')]"
+    ]
+
+async def test_init_db_adds_missing_columns(override_db):
+    async with database.engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE monitors DROP COLUMN raw_hash"))
+
+    await database.init_db()
+
+    async with database.engine.connect() as conn:
+        columns = await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns("monitors")})
+    assert "raw_hash" in columns
 
-@pytest.mark.asyncio
-async def test_get_all_active_monitors(override_db):
+async def test_init_db_clears_hex_hashes(override_db):
+    digest = b"\x01" * database.HASH_SIZE
+    async with database.engine.begin() as conn:
+        # Rows written by earlier versions hold hex strings (sha256 or xxh3)
+        await conn.execute(
+            text(
+                "INSERT INTO monitors (user_id, url, frequency, is_active, content_hash, raw_hash) "
+                "VALUES (1, 'http://a.com', 60, 1, :sha256_hex, :xxh3_hex)"
+            ),
+            {"sha256_hex": "a" * 64, "xxh3_hex": "b" * 32},
+        )
     async with database.async_session() as session:
-        m1 = Monitor(user_id=1, url="http://a.com", is_active=True)
-        m2 = Monitor(user_id=2, url="http://b.com", is_active=False)
-        session.add_all([m1, m2])
+        session.add(Monitor(user_id=1, url="http://b.com", content_hash=digest, raw_hash=digest))
         await session.commit()
 
-    monitors = await get_all_active_monitors()
-    assert len(monitors) == 1
-    assert monitors[0].url == "http://a.com"
+    await database.init_db()
 
-    assert monitors[0].url == "http://a.com"
+    async with database.async_session() as session:
+        result = await session.execute(
+            select(Monitor.url, Monitor.content_hash, Monitor.raw_hash).order_by(Monitor.url)
+        )
+        assert result.all() == [("http://a.com", None, None), ("http://b.com", digest, digest)]
+
+async def test_memory_engine_pragmas():
+    engine = _memory_engine()
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar_one() == "memory"
+        assert (await conn.execute(text("PRAGMA synchronous"))).scalar_one() == 0  # OFF
+        assert (await conn.execute(text("PRAGMA temp_store"))).scalar_one() == 2  # MEMORY
+    await engine.dispose()
+
+async def test_sqlite_pragmas(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.sqlite3'}")
+    event.listen(engine.sync_engine, "connect", database._set_sqlite_pragmas)
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar_one() == "wal"
+        assert (await conn.execute(text("PRAGMA synchronous"))).scalar_one() == 1  # NORMAL
+        assert (await conn.execute(text("PRAGMA temp_store"))).scalar_one() == 2  # MEMORY
+    await engine.dispose()
+
+def test_engine_options_memory():
+    assert database._engine_options("sqlite+aiosqlite:///:memory:") == {}
 
+def test_engine_options_sqlite_file():
+    options = database._engine_options("sqlite+aiosqlite:///data/bot.sqlite3")
+    assert options["pool_size"] == database.DB_POOL_SIZE
+    assert options["max_overflow"] == database.DB_MAX_OVERFLOW
+    assert options["connect_args"] == {"check_same_thread": False}
+    assert "pool_use_lifo" not in options
 
+def test_engine_options_server():
+    options = database._engine_options("postgresql+asyncpg://u:p@host/db")
+    assert options["pool_use_lifo"] is True
+    assert options["pool_pre_ping"] is True
+    assert "connect_args" not in options
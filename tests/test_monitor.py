@@ -1,6 +1,27 @@
-from monitor import PageMonitor
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+import database
+import monitor
+from monitor import PageMonitor, PageState
 from unittest.mock import MagicMock, patch
 
+@pytest.fixture(scope="module")
+def _session_get():
+    # Started once per module; tests only change the return value/side effect
+    patcher = patch("monitor._SESSION.get")
+    yield patcher.start()
+    patcher.stop()
+
+@pytest.fixture(autouse=True)
+def mock_get(_session_get):
+    _session_get.reset_mock(return_value=True, side_effect=True)
+    return _session_get
+
 def test_clean_content():
     html = "<html><script>var x=1;</script><body><style>body{color:red;}</style><p>Hello World</p></body></html>"
     text = PageMonitor.clean_content(html)
@@ -8,62 +29,98 @@ def test_clean_content():
 
 def test_get_content_hash():
     text = "Hello World"
-    # echo -n "Hello World" | shasum -a 256
-    expected = "a591a6d40bf420404a011733cfb7b190d62c65bf0bcda32b57b277d9ad9f146e"
+    # xxhash.xxh3_128_digest(b"Hello World")
+    expected = bytes.fromhex("403383a15c99beee9ac3af2126a00292")
     assert PageMonitor.get_content_hash(text) == expected
+    assert len(expected) == database.HASH_SIZE
+
+def _response(html, status_code=200, headers=None):
+    return MagicMock(content=html.encode("utf-8"), text=html, status_code=status_code, headers=headers or {})
 
-@patch("monitor.PageMonitor.fetch_content")
-def test_check_for_changes_new(mock_fetch):
-    mock_fetch.return_value = "<html>Hello</html>"
+def test_check_for_changes_new(mock_get):
+    mock_get.return_value = _response("<html>Hello</html>")
     
-    new_hash, changed, summary = PageMonitor.check_for_changes("http://example.com", None)
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", PageState())
     
     assert changed is False
     assert "Initial check" in summary
-    assert new_hash is not None
+    assert new_state.content_hash is not None
+    assert new_state.raw_hash == PageMonitor.get_raw_hash(b"<html>Hello</html>")
 
-@patch("monitor.PageMonitor.fetch_content")
-def test_check_for_changes_no_change(mock_fetch):
-    mock_fetch.return_value = "<html>Hello</html>"
+def test_check_for_changes_no_change(mock_get):
+    mock_get.return_value = _response("<html>Hello</html>")
     # Pre-calculate hash
     old_hash = PageMonitor.get_content_hash("Hello")
     
-    new_hash, changed, summary = PageMonitor.check_for_changes("http://example.com", old_hash)
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", PageState(old_hash))
     
     assert changed is False
-    assert new_hash == old_hash
+    assert new_state.content_hash == old_hash
     assert summary == "No changes."
 
-@patch("monitor.PageMonitor.fetch_content")
-def test_check_for_changes_changed(mock_fetch):
-    mock_fetch.return_value = "<html>Hello Changed</html>"
+def test_check_for_changes_changed(mock_get):
+    mock_get.return_value = _response("<html>Hello Changed</html>")
     old_hash = PageMonitor.get_content_hash("Hello")
     
-    new_hash, changed, summary = PageMonitor.check_for_changes("http://example.com", old_hash)
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", PageState(old_hash))
     
     assert changed is True
-    assert new_hash != old_hash
+    assert new_state.content_hash != old_hash
     assert "Content changed" in summary
 
-@patch("monitor.PageMonitor.fetch_content")
-def test_check_for_changes_fetch_fail(mock_fetch):
-    mock_fetch.return_value = None
+@patch("monitor.PageMonitor.clean_content")
+def test_check_for_changes_raw_unchanged(mock_clean, mock_get):
+    mock_get.return_value = _response("<html>Hello</html>")
+    old_state = PageState(b"oldhash", PageMonitor.get_raw_hash(b"<html>Hello</html>"))
+    
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", old_state)
+    
+    assert changed is False
+    assert new_state == old_state
+    assert summary == "No changes."
+    mock_clean.assert_not_called()
+
+def test_check_for_changes_stores_validators(mock_get):
+    mock_get.return_value = _response("<html>Hello</html>", headers={"ETag": '"v1"', "Last-Modified": "Mon"})
+    
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", PageState())
+    
+    headers = mock_get.call_args.kwargs["headers"]
+    assert "If-None-Match" not in headers
+    assert "If-Modified-Since" not in headers
+    assert new_state.etag == '"v1"'
+    assert new_state.last_modified == "Mon"
+
+@patch("monitor.PageMonitor.clean_content")
+def test_check_for_changes_not_modified(mock_clean, mock_get):
+    mock_get.return_value = _response("", status_code=304)
+    old_state = PageState(b"oldhash", b"oldraw", '"v1"', "Mon")
+    
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", old_state)
+    
+    headers = mock_get.call_args.kwargs["headers"]
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Mon"
+    assert changed is False
+    assert new_state == old_state
+    assert summary == "No changes."
+    mock_clean.assert_not_called()
+
+def test_check_for_changes_fetch_fail(mock_get):
+    mock_get.side_effect = RequestException("Boom")
     
-    new_hash, changed, summary = PageMonitor.check_for_changes("http://example.com", "oldhash")
+    new_state, changed, summary = PageMonitor.check_for_changes("http://example.com", PageState(b"oldhash"))
     
     assert changed is False
-    assert new_hash == "oldhash"
+    assert new_state.content_hash == b"oldhash"
     assert "Failed to fetch" in summary
 
-@patch("monitor.requests.get")
 def test_fetch_content_exception(mock_get):
-    from requests import RequestException
     mock_get.side_effect = RequestException("Boom")
     
     content = PageMonitor.fetch_content("http://bad.com")
     assert content is None
 
-@patch("monitor.requests.get")
 def test_fetch_content_success(mock_get):
     mock_resp = MagicMock()
     mock_resp.text = "ok"
@@ -71,3 +128,47 @@ def test_fetch_content_success(mock_get):
     
     content = PageMonitor.fetch_content("http://good.com")
     assert content == "ok"
+
+
+def test_fetch_page_reuses_session(mock_get):
+    PageMonitor.fetch_page("http://a.com")
+    PageMonitor.fetch_page("https://b.com")
+    assert mock_get.call_count == 2
+    adapter = monitor._SESSION.get_adapter("https://b.com")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == monitor._HTTP_POOL_SIZE
+
+def test_fetch_page_conditional_headers(mock_get):
+    PageMonitor.fetch_page("http://good.com", '"v1"', "Mon")
+    headers = mock_get.call_args.kwargs["headers"]
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Mon"
+
+def test_fetch_page_does_not_replay_cookies(mock_get):
+    # Real HTTP round trips against a local server, through the shared session
+    mock_get.side_effect = lambda *args, **kwargs: requests.Session.get(monitor._SESSION, *args, **kwargs)
+    received_cookies = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            received_cookies.append(self.headers.get("Cookie"))
+            self.send_response(200)
+            self.send_header("Set-Cookie", "variant=B; Path=/")
+            self.end_headers()
+            self.wfile.write(b"<html>ok</html>")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        assert PageMonitor.fetch_page(f"{base_url}/a") is not None
+        assert PageMonitor.fetch_page(f"{base_url}/b") is not None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert received_cookies == [None, None]